@@ -1,168 +1,241 @@
 # schild2jamf.py
 
-import xml.etree.ElementTree as ET
+from lxml import etree
 import mappings
 import re
+import sys
 import utils
 import os
 import csv
+import mmap
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import chain, repeat
 from unidecode import unidecode
 
 
+# School number, used as prefix of the JAMF usernames and as mail domain
+SCHULNUMMER = "164501"
+
+# Path of the current XML file containing the user, group, and membership information
+INPUT_XML = "./xml/SchILD20241007.xml"
+
+# Namespace of the SchILD cockpit sync export
+NAMESPACE = "http://www.metaventis.com/ns/cockpit/sync/1.0"
+NS = {"c": NAMESPACE}
+
+# Fully qualified tags of the top-level records
+PERSON = "{" + NAMESPACE + "}person"
+GROUP = "{" + NAMESPACE + "}group"
+MEMBERSHIP = "{" + NAMESPACE + "}membership"
+
+# Precompiled XPath expressions for the fields read from each record. The
+# paths are relative to the record element, so no descendant scan is needed.
+XP_ID = etree.XPath("c:sourcedid/c:id/text()", namespaces=NS, smart_strings=False)
+XP_FAMILY = etree.XPath("c:name/c:n/c:family/text()", namespaces=NS, smart_strings=False)
+XP_GIVEN = etree.XPath("c:name/c:n/c:given/text()", namespaces=NS, smart_strings=False)
+XP_ROLE = etree.XPath("c:institutionrole/@institutionroletype", namespaces=NS, smart_strings=False)
+XP_EMAIL = etree.XPath("c:email/text()", namespaces=NS, smart_strings=False)
+XP_BDAY = etree.XPath("c:demographics/c:bday/text()", namespaces=NS, smart_strings=False)
+XP_GROUP_NAME = etree.XPath("c:description/c:short/text()", namespaces=NS, smart_strings=False)
+XP_PARENT_ID = etree.XPath("c:relationship/c:sourcedid/c:id/text()", namespaces=NS, smart_strings=False)
+XP_MEMBER_ID = etree.XPath("c:member/c:sourcedid/c:id/text()", namespaces=NS, smart_strings=False)
+
+# German umlauts are spelled out before the remaining characters are
+# transliterated by unidecode
+UMLAUT_TRANS = str.maketrans(
+    {"ä": "ae", "ö": "oe", "ü": "ue", "Ä": "Ae", "Ö": "Oe", "Ü": "Ue"}
+)
+
+# Characters removed from last names when building usernames
+STRIP_SPACE_HYPHEN = str.maketrans("", "", " -")
+
+# Replacements applied in a single pass when renaming class groups and
+# course groups
+KLASSE_SUBS = {" ": "", "-": "", ")": "", "Schueler": "S", "Lehrer": "L", "UNESCO": "U"}
+KLASSE_SUBS_RE = re.compile(r"[ )-]|Schueler|Lehrer|UNESCO")
+KURS_SUBS = {"Schueler": "S", "Lehrer": "L", "--": "-", ")": ""}
+KURS_SUBS_RE = re.compile(r"Schueler|Lehrer|--|\)")
+
+# The first four comma separated parts of a course group's parentheses
+KURS_PARTS_RE = re.compile(r"(?P<fach>[^,]*),(?P<kursart>[^,]*),(?P<teil3>[^,]*),(?P<teil4>[^,]*)")
+
+# First digit of a course group name, e.g. the grade
+DIGIT_RE = re.compile(r"\d")
+
+# Grades whose groups are passed on to the teacher accounts, and the
+# teacher groups of those grades that are left out
+GRADE_RE = re.compile(r"09|10|EF|Q1")
+SKIP_TEACHER_GROUPS = frozenset({"EFL24", "Q1L24", "Q2L24"})
+
+# Everything but digits, used to extract the export date from the file name
+NON_DIGIT_RE = re.compile(r"\D+")
+
+# Device groups appended to the groups of every teacher account
+TEACHER_EXTRA_GROUPS = (
+    ", iPads-Lehrerzimmer_1-15, iPads-Lehrerzimmer_alle, iPads-Lehrerzimmer_16-30"
+)
+
+# Buffer size for the generated CSV files, to keep the number of writes low
+WRITE_BUFFER_SIZE = 1 << 20
+
+# School year as written in the export, e.g. '2024/25'
+YEAR_RE = re.compile(rb"20(\d{2})/(\d{2})")
+
+
+@dataclass(slots=True, eq=False)
 class User:
-    def __init__(
-        self,
-        lehrerid,
-        name,
-        given,
-        institutionrole,
-        email,
-        birthday,
-        username,
-        initialpassword,
-    ):
-        self.lehrerid = lehrerid
-        self.name = name
-        self.given = given
-        self.institutionrole = institutionrole
-        self.email = email
-        self.birthday = birthday
-        self.username = username
-        self.initialpassword = initialpassword
+    lehrerid: str
+    name: str
+    given: str
+    institutionrole: str
+    email: str
+    birthday: str
+    username: str
+    initialpassword: str
+    # First and last name as exported to JAMF, derived from the username
+    jamf_firstname: str = field(init=False)
+    jamf_lastname: str = field(init=False)
+
+    def __post_init__(self):
+        # Emails are compared case-insensitively, so store them normalized once
+        self.email = self.email.strip().lower() if self.email else ""
+        self.jamf_firstname = self.username[:4]
+        self.jamf_lastname = self.username[4:]
 
     def __repr__(self):  # optional
         return f"User {self.name}"
 
 
+@dataclass(slots=True, eq=False)
 class Group:
-    def __init__(self, groupid, name, parent):
-        self.groupid = groupid
-        self.name = name
-        self.parent = parent
+    groupid: str
+    name: str
+    parent: str
 
     def __repr__(self):  # optional
         return f"Group {self.name}"
 
 
+@dataclass(slots=True, eq=False)
 class Membership:
-    def __init__(self, membershipid, groupid, nameid):
-        self.membershipid = membershipid
-        self.groupid = groupid
-        self.nameid = nameid
+    groupid: str
+    nameid: str
 
     def __repr__(self):  # optional
         return f"Membership {self.groupid}"
 
 
-def parse_users(users):
+def parse_user(elem, users, usernames):
     """
-    Parses user data from an XML structure and appends User objects to the provided list.
+    Parses a single person element and appends a User object to the provided list.
 
-    This function iterates over XML elements representing persons. Each person element contains 
-    sub-elements with detailed information about teachers (faculty or extern) and students.
+    The person element contains sub-elements with detailed information about a
+    teacher (faculty or extern) or a student.
 
-    For each user, the function:
+    For the user, the function:
     - Extracts user information, including ID, name, given name, email, and role.
     - Constructs a username based on the user's role:
       - For students, uses a short-form username.
       - For faculty or extern, uses a "vorname.nachname" format.
-    - Checks for duplicate usernames and appends '1' to the username if a duplicate is found.
+      - Persons with any other role are skipped with a printed warning and no
+        User is created.
+    - Checks for duplicate usernames and appends '1' to the username until it is unique.
     - Calculates an initial password based on user attributes.
     - Extracts or formats additional user-specific details like birthday.
     - Creates a User object with the parsed data and appends it to the 'users' list. 
 
     Args:
+        elem (Element): The 'person' element to parse.
         users (list): A list to populate with User objects created from parsed XML data.
+        usernames (set): The usernames assigned so far; the new username is added to it.
 
-    Elements:
-        - Person
-          - id: Unique identifier for the user.
-          - family: Last name of the user.
-          - given: First name of the user.
-          - institutionrole: Role of the user within the institution (Student, faculty, extern).
+    XML Structure:
+        - person
+          - sourcedid
+            - id: Unique identifier for the user.
+          - name
+            - n
+              - family: Last name of the user.
+              - given: First name of the user.
+          - demographics
+            - bday: Birthday of the user, formatted as 'YYYY-MM-DD' for students.
           - email: Email address of the user, if available.
-          - bday: Birthday of the user, formatted as 'YYYY-MM-DD' for students.
+          - institutionrole: Role of the user within the institution (Student, faculty, extern),
+            stored in the 'institutionroletype' attribute.
     """
-    for elem in root.findall(
-        ".//{http://www.metaventis.com/ns/cockpit/sync/1.0}person"
-    ):
-        # Extracts the ID for each person
-        for child in elem.findall(
-            ".//{http://www.metaventis.com/ns/cockpit/sync/1.0}id"
-        ):
-            lehrerid = child.text
-
-        # Extracts the last name
-        for child in elem.findall(
-            ".//{http://www.metaventis.com/ns/cockpit/sync/1.0}family"
-        ):
-            name = child.text
-
-        # Extracts the given name
-        for child in elem.findall(
-            ".//{http://www.metaventis.com/ns/cockpit/sync/1.0}given"
-        ):
-            given = child.text
-
-        # Extracts the user's role within the institution
-        for child in elem.findall(
-            ".//{http://www.metaventis.com/ns/cockpit/sync/1.0}institutionrole"
-        ):
-            institutionrole = child.get("institutionroletype")
-        
-        # Attempts to find and store the email, defaults to an empty string
-        email = ""
-        for child in elem.findall(
-            ".//{http://www.metaventis.com/ns/cockpit/sync/1.0}email"
-        ):
-            email = child.text
-
-        # Handles student-specific attributes
-        if institutionrole == "Student":
-            for child in elem.findall(
-                ".//{http://www.metaventis.com/ns/cockpit/sync/1.0}bday"
-            ):
-                birthdaytemp = child.text.split("-")
-                birthday = f"{birthdaytemp[2]}.{birthdaytemp[1]}.{birthdaytemp[0]}"
-            # Generates a username for students in shortform
-            tempusername = return_username(given, name, "kurzform")
-
-        # Handles faculty or extern-specific attributes
-        if institutionrole == "faculty" or institutionrole == "extern":
-            # Generates a username in "vorname.nachname" format
-            tempusername = return_username(given, name, "vorname.nachname")
+    # Extracts the ID for each person
+    lehrerid = XP_ID(elem)[0]
+
+    # Extracts the last name
+    name = XP_FAMILY(elem)[0]
+
+    # Extracts the given name
+    given = XP_GIVEN(elem)[0]
+
+    # Extracts the user's role within the institution; there are only a few
+    # distinct roles, so all users share one string object per role
+    institutionrole = sys.intern(XP_ROLE(elem)[0])
+
+    # Attempts to find and store the email, defaults to an empty string
+    emails = XP_EMAIL(elem)
+    email = emails[0] if emails else ""
+
+    # Handles student-specific attributes
+    if institutionrole == "Student":
+        # Students without a birthday in the export get an empty birthday
+        bdays = XP_BDAY(elem)
+        if bdays:
+            year, month, day = bdays[0].split("-", 2)
+            birthday = f"{day}.{month}.{year}"
+        else:
             birthday = ""
-
-        # Resolves duplicate usernames by appending '1' if necessary
-        for user in users:
-            if tempusername == user.username:
-                tempusername = tempusername + "1"
-
-        # Calculates the initial password
-        initialPassword = f"{lehrerid[-3:]}{tempusername[-2:]}{strip_hyphens_from_birthday(birthday)[:3]}{tempusername[:2]}"
-
-        # Appends a new User object to the users list with all extracted and calculated data
-        users.append(
-            User(
-                lehrerid,
-                name,
-                given,
-                institutionrole,
-                email,
-                birthday,
-                tempusername,
-                initialPassword,
-            )
+        # Generates a username for students in shortform
+        tempusername = return_username(given, name, "kurzform")
+
+    # Handles faculty or extern-specific attributes
+    elif institutionrole == "faculty" or institutionrole == "extern":
+        # Generates a username in "vorname.nachname" format
+        tempusername = return_username(given, name, "vorname.nachname")
+        birthday = ""
+
+    # Persons with any other role (e.g. staff) get no account; report them so
+    # the dropped accounts are visible to whoever runs the export
+    else:
+        print(f"Warning: skipping person {lehrerid} with role '{institutionrole}'")
+        return
+
+    # Resolves duplicate usernames by appending '1' until the username is unique
+    while tempusername in usernames:
+        tempusername = tempusername + "1"
+    usernames.add(tempusername)
+
+    # Calculates the initial password
+    initialPassword = initial_password(lehrerid, tempusername, birthday)
+
+    # Appends a new User object to the users list with all extracted and calculated data
+    users.append(
+        User(
+            lehrerid,
+            name,
+            given,
+            institutionrole,
+            email,
+            birthday,
+            tempusername,
+            initialPassword,
         )
+    )
 
 
-def parse_groups(groups):
+def parse_group(elem, groups):
     """
-    Parses group data from an XML structure and appends Group objects to 
-    the provided groups list.
+    Parses a single group element and appends a Group object to the 
+    provided groups list.
 
-    This function iterates over XML elements representing groups and extracts 
-    relevant information for each group. The parsed data includes:
+    This function extracts the relevant information from the group element.
+    The parsed data includes:
     - The unique identifier for the group (groupid).
     - The name of the group, derived from its short description.
     - The parent group ID, if a hierarchical relationship exists between 
@@ -172,6 +245,7 @@ def parse_groups(groups):
     and appends it to the 'groups' list.
 
     Args:
+        elem (Element): The 'group' element to parse.
         groups (list): A list to populate with Group objects created 
                        from parsed XML data.
 
@@ -185,31 +259,19 @@ def parse_groups(groups):
             - sourcedid
                 - id: Unique identifier of the parent group (if any).
     """
-    parent = ""  # Initialize the parent variable for storing parent group ID
-
-    # Find all 'group' elements in the XML document using the specific namespace
-    for elem in root.findall(".//{http://www.metaventis.com/ns/cockpit/sync/1.0}group"):
-        
-        # Extract the group ID from each group element
-        for child in elem.findall(
-            "{http://www.metaventis.com/ns/cockpit/sync/1.0}sourcedid/{http://www.metaventis.com/ns/cockpit/sync/1.0}id"
-        ):
-            groupid = child.text  # Get the text of the current XML element
+    # Extract the group ID from each group element; interned, since the same
+    # IDs are repeated by many memberships
+    groupid = sys.intern(XP_ID(elem)[0])
 
-        # Extract the short description of the group, which serves as the group's name
-        for child in elem.findall(
-            "{http://www.metaventis.com/ns/cockpit/sync/1.0}description/{http://www.metaventis.com/ns/cockpit/sync/1.0}short"
-        ):
-            name = child.text  # Get the text of the current XML element
+    # Extract the short description of the group, which serves as the group's name
+    name = XP_GROUP_NAME(elem)[0]
 
-        # Extract the parent ID of the current group, if it exists
-        for child in elem.findall(
-            "{http://www.metaventis.com/ns/cockpit/sync/1.0}relationship/{http://www.metaventis.com/ns/cockpit/sync/1.0}sourcedid/{http://www.metaventis.com/ns/cockpit/sync/1.0}id"
-        ):
-            parent = child.text  # Get the text of the current XML element
+    # Extract the parent ID of the current group, if it exists
+    parents = XP_PARENT_ID(elem)
+    parent = sys.intern(parents[0]) if parents else ""
 
-        # Create a Group object and append it to the groups list
-        groups.append(Group(groupid, name, parent))
+    # Create a Group object and append it to the groups list
+    groups.append(Group(groupid, name, parent))
 
 
 def rename_groups():
@@ -243,95 +305,72 @@ def rename_groups():
 
     This function assumes the presence of the `groups` list and `schuljahr` variable, 
     along with a `mappings.mappinggroups` dictionary for specialized name conversion.
+
+    Raises:
+        ValueError: If the parentheses of a course group name do not hold at least
+                    four comma separated parts.
     """
+    # The school year appended to renamed groups
+    suffix = schuljahr
+
     for group in groups:
         # Check if the group's name contains "Klasse"
         if "Klasse" in group.name:
             # Process the name by stripping unwanted characters and appending the school year
             group.name = (
-                f'{group.name[7:].replace(" ", "").replace("Schueler", "S").replace("Lehrer", "L").replace("--", "").replace("-", "").replace(")", "").replace("UNESCO","U")}'
-                + f"{schuljahr}"
+                KLASSE_SUBS_RE.sub(lambda m: KLASSE_SUBS[m.group(0)], group.name[7:])
+                + suffix
             )
 
-        # For groups involving "BI8" (assumed special processing)
-        if "BI8" in group.name:
-            # Find positions of parentheses in the name
-            start = group.name.rfind("(")
-            ende = group.name.rfind(")")
-            try:
-                # Search for a digit in the name outside the parentheses
-                m = re.search(r"\d", group.name)
-                digitfound = m.group(0)
-            except:
-                digitfound = ""
-
-            # Extract content between parentheses, split and clean it
-            templist = (
-                group.name[start - 3 : ende]
-                .replace(" ", "")
-                .replace("(9", "")
-                .split(",")
-            )
+        name = group.name
 
-            # Construct the new name based on refined components
-            group.name = (
-                f"{templist[0]}{templist[1] if templist[1] == 'GK' or templist[1] == 'LK' else ''}{digitfound if templist[1] == 'GK' or templist[1] == 'LK' else ''}{templist[2]}{templist[3]}".replace(
-                    "Schueler", "S"
-                )
-                .replace("Lehrer", "L")
-                .replace("--", "-")
-                .replace(")", "")
-                + f"{schuljahr}"
-            )
+        # Positions of the parentheses, shared by the "BI8" and general
+        # parenthesis branches below
+        start = name.rfind("(")
+        ende = name.rfind(")")
+
+        # For groups involving "BI8" (assumed special processing), take the
+        # content between the parentheses together with the preceding characters
+        if "BI8" in name:
+            kurs = name[start - 3 : ende].replace(" ", "").replace("(9", "")
 
         # General processing for names with parentheses that are not "BI8"
-        elif "(" in group.name:
-            # Find the start and end positions of the first set of parentheses
-            start = group.name.rfind("(")
-            ende = group.name.rfind(")")
-            try:
-                # Attempt to find a digit in the main part of the name
-                m = re.search(r"\d", group.name)
-                digitfound = m.group(0)
-            except:
-                digitfound = ""
-
-            # Extract, process and split the content within parentheses
-            templist = (
-                group.name[start + 1 : ende]
-                .replace(" ", "")
-                .replace("UNESCO", "U")
-                .split(",")
-            )
+        elif "(" in name:
+            kurs = name[start + 1 : ende].replace(" ", "").replace("UNESCO", "U")
+
+        else:
+            kurs = None
+
+        if kurs is not None:
+            # Split the extracted content into its first four comma separated parts
+            parts = KURS_PARTS_RE.match(kurs)
+            if parts is None:
+                raise ValueError(f"Unexpected course group name: {name}")
+            fach, kursart, teil3, teil4 = parts.groups()
+
+            # Only GK and LK courses keep their course type and the first digit
+            # found in the name
+            if kursart == "GK" or kursart == "LK":
+                m = DIGIT_RE.search(name)
+                kursart += m.group(0) if m else ""
+            else:
+                kursart = ""
 
             # Reassemble the new group name
             group.name = (
-                f"{templist[0]}{templist[1] if templist[1] == 'GK' or templist[1] == 'LK' else ''}{digitfound if templist[1] == 'GK' or templist[1] == 'LK' else ''}{templist[2]}{templist[3]}".replace(
-                    "Schueler", "S"
+                KURS_SUBS_RE.sub(
+                    lambda m: KURS_SUBS[m.group(0)], f"{fach}{kursart}{teil3}{teil4}"
                 )
-                .replace("Lehrer", "L")
-                .replace("--", "-")
-                .replace(")", "")
-                + f"{schuljahr}"
+                + suffix
             )
 
         # Process specific group names containing "Alle - Schueler"
         if "Alle - Schueler" in group.name:
-            group.name = (
-                "Alle-Schueler".replace("Schueler", "S")
-                .replace("Lehrer", "L")
-                .replace(")", "")
-                .replace("-", "")
-            )
+            group.name = "AlleS"
 
         # Process specific group names containing "Alle - Lehrer"
         if "Alle - Lehrer" in group.name:
-            group.name = (
-                "Alle-Lehrer".replace("Schueler", "S")
-                .replace("Lehrer", "L")
-                .replace(")", "")
-                .replace("-", "")
-            )
+            group.name = "AlleL"
 
         # Map specialized names for groups containing "Fach"
         if "Fach" in group.name:
@@ -342,21 +381,21 @@ def rename_groups():
             group.name = mappings.mappinggroups[group.name]
 
 
-def parse_memberships(memberships):
+def parse_membership(elem, memberships):
     """
-    Parses membership data from an XML structure and appends Membership objects 
+    Parses a single membership element and appends a Membership object 
     to the provided memberships list.
 
-    This function iterates over XML elements representing membership relationships,
-    extracting necessary details for each membership, such as:
+    This function extracts the necessary details of the membership relationship,
+    such as:
     - The unique identifier for the group (groupid) that the member is part of.
     - The unique identifier for the member (nameid) associated with the group.
 
-    An internal counter 'i' is used to assign a unique membership ID for each 
-    relationship. For each parsed membership, the function creates a Membership 
-    object and appends it to the 'memberships' list.
+    The function creates a Membership object and appends it to the 
+    'memberships' list.
 
     Args:
+        elem (Element): The 'membership' element to parse.
         memberships (list): A list to populate with Membership objects created 
                             from parsed XML data.
 
@@ -368,42 +407,35 @@ def parse_memberships(memberships):
             - sourcedid
                 - id: Unique identifier of the member associated with the group.
     """
-    i = 0  # Initialize a counter for membership IDs
-    # Find all membership elements in the XML document using the specific namespace
-    for elem in root.findall(
-        ".//{http://www.metaventis.com/ns/cockpit/sync/1.0}membership"
-    ):
-        # Extract the group ID from the membership element
-        for child in elem.findall(
-            "{http://www.metaventis.com/ns/cockpit/sync/1.0}sourcedid/{http://www.metaventis.com/ns/cockpit/sync/1.0}id"
-        ):
-            groupid = child.text  # Get the text of the current XML element representing the group ID
-        # Extract the member ID associated with the group
-        for child in elem.findall(
-            "{http://www.metaventis.com/ns/cockpit/sync/1.0}member/{http://www.metaventis.com/ns/cockpit/sync/1.0}sourcedid/{http://www.metaventis.com/ns/cockpit/sync/1.0}id"
-        ):
-            nameid = child.text  # Get the text of the current XML element representing the member ID
-        # Create a Membership object and append it to the memberships list
-        memberships.append(Membership(i, groupid, nameid))
-        i += 1  # Increment the membership ID counter
-
-
-def parse_xml(users, groups, memberships):
+    # Extract the group ID from the membership element, sharing the interned ID
+    groupid = sys.intern(XP_ID(elem)[0])
+    # Extract the member ID associated with the group
+    nameid = XP_MEMBER_ID(elem)[0]
+    # Create a Membership object and append it to the memberships list
+    memberships.append(Membership(groupid, nameid))
+
+
+def parse_xml(xmlfile, users, groups, memberships):
     """
     Parses XML data to populate lists of users, groups, and memberships.
 
-    This function orchestrates the parsing of XML data to create objects for 
-    users, groups, and memberships from a specified XML structure. It calls 
-    separate parsing functions for each type of data:
+    This function streams the XML file with lxml's iterparse and handles each 
+    person, group and membership element as soon as it has been read completely,
+    so the whole document never has to be held in memory. Each record is
+    dispatched to the matching parsing function:
+
+    - Person elements are parsed into User objects and appended to the 
+      provided 'users' list.
+    - Group elements are parsed into Group objects and appended to the 
+      provided 'groups' list.
+    - Membership elements are parsed into Membership objects and appended to
+      the provided 'memberships' list.
 
-    - Parses user-related XML data to create User objects and appends them 
-      to the provided 'users' list.
-    - Parses group-related XML data to create Group objects and appends them 
-      to the provided 'groups' list.
-    - Parses membership-related XML data to create Membership objects and 
-      appends them to the provided 'memberships' list.
+    After a record has been parsed, the element and its already processed 
+    siblings are removed from the partially built tree to free memory.
 
     Args:
+        xmlfile (str): The path to the XML file to be parsed.
         users (list): A list to be populated with User objects parsed from the 
                       XML data.
         groups (list): A list to be populated with Group objects parsed from the 
@@ -411,51 +443,68 @@ def parse_xml(users, groups, memberships):
         memberships (list): A list to be populated with Membership objects parsed 
                             from the XML data.
     """
-    # Parse user data from the XML and populate the users list with User objects
-    parse_users(users)
-    
-    # Parse group data from the XML and populate the groups list with Group objects
-    parse_groups(groups)
-    
-    # Parse membership data from the XML and populate the memberships list with Membership objects
-    parse_memberships(memberships)
+    usernames = set()  # Usernames assigned so far, used to resolve duplicates
+    # Large exports may exceed libxml2's default size limits; entities, network
+    # access and the xml:id table are not needed for the export
+    for _, elem in etree.iterparse(
+        xmlfile,
+        events=("end",),
+        tag=(PERSON, GROUP, MEMBERSHIP),
+        huge_tree=True,
+        resolve_entities=False,
+        no_network=True,
+        collect_ids=False,
+    ):
+        # Dispatch the record to the parsing function for its type
+        if elem.tag == PERSON:
+            parse_user(elem, users, usernames)
+        elif elem.tag == GROUP:
+            parse_group(elem, groups)
+        else:
+            parse_membership(elem, memberships)
+
+        # Release the parsed record and all records processed before it
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
 
 
 def parse_year(xmlfile):
     """
     Parses the XML file to determine the school year format.
 
-    This function tests for two potential year formats within the contents of the specified XML file:
-    - The first format checks for the pattern '20ij/ij+1', where 'i' and 'j' are single digits representing the year.
-    - The second format checks for '20ij/i+10', handling cases where the second half of the year spans a decade.
+    This function memory-maps the specified XML file and scans it with a single
+    precompiled regular expression for school years written as '20ij/kl', so the
+    file is never copied into memory as a whole. A match is only accepted if 'kl'
+    is the year following 'ij', which also covers school years spanning a decade
+    (e.g. '2029/30'). An empty file cannot be mapped and contains no school year,
+    so None is returned for it right away.
 
-    The function iterates over combinations of 'i' and 'j' from '00' to '99', and searches for these formats.
     Once a matching format is found, it prints the matched year pattern and returns the starting year as a two-digit string.
 
     Args:
         xmlfile (str): The path to the XML file to be read and analyzed for determining the school year.
 
     Returns:
-        str: A two-digit string representing the starting year of the identified school year format.
-    """
-    # Iterate over possible year representations from '00' to '99'
-    for i in range(10):
-        for j in range(10):
-            # Open the XML file for reading
-            with open(xmlfile) as f:
-                # Construct the school year format '20ij/ij+1' and check if it exists in the file
-                if f"20{i}{j}/{i}{j+1}" in f.read():
-                    # If found, print the year
-                    print(f"{i}{j}/{i}{j+1}")
-                    # Return the year as a two-digit string representing the starting year
-                    return f"{i}{j}"
-                
-                # Construct the school year format '20ij/i+10' and check if it exists in the file
-                if f"20{i}{j}/{i+1}0" in f.read():
-                    # If found, print the year
-                    print(f"{i}{j}/{i+1}0")
-                    # Return the year as a two-digit string representing the starting year
-                    return f"{i}{j}"
+        str: A two-digit string representing the starting year of the identified school year format,
+             or None if no school year is found.
+    """
+    # Empty files cannot be memory-mapped and contain no school year
+    if os.path.getsize(xmlfile) == 0:
+        return None
+
+    # Map the XML file as raw bytes; the year is plain ASCII
+    with open(xmlfile, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        # Check every '20ij/kl' candidate for a pair of consecutive years
+        for m in YEAR_RE.finditer(data):
+            start, end = m.group(1).decode(), m.group(2).decode()
+            if int(end) == (int(start) + 1) % 100:
+                # If found, print the year
+                print(f"{start}/{end}")
+                # Return the year as a two-digit string representing the starting year
+                return start
 
 
 def return_webuntis_uid(user):
@@ -485,15 +534,16 @@ def return_webuntis_uid(user):
     )
 
 
+@lru_cache(maxsize=None)
 def custom_transliterate(name):
-    translations = {
-        'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 
-        'Ä': 'Ae', 'Ö': 'Oe', 'Ü': 'Ue'
-    }
-    for original, replacement in translations.items():
-        name = name.replace(original, replacement)
+    name = name.translate(UMLAUT_TRANS)
+    # Most names are plain ASCII once the umlauts are spelled out, which
+    # unidecode would return unchanged
+    if name.isascii():
+        return name
     return unidecode(name)
 
+@lru_cache(maxsize=None)
 def return_username(given, last, typ):
     """
     Generates a username based on the specified type from given and last name strings.
@@ -508,7 +558,8 @@ def return_username(given, last, typ):
       - Translating the given name and extracting the first 4 characters.
       - Translating the last name (removing spaces and hyphens) and then taking its first 4 characters.
 
-    The resulting username is returned in lowercase.
+    The resulting username is returned in lowercase. Results are cached, since the 
+    same names are looked up repeatedly while parsing and writing the CSV files.
 
     Args:
         given (str): The given name to use in the username.
@@ -518,172 +569,203 @@ def return_username(given, last, typ):
     Returns:
         str: A generated username in lowercase.
     """
+    # Translate both names once: the first segment of the given name before any
+    # space, and the last name with all spaces and hyphens removed
+    first = custom_transliterate(given).split(" ", 1)[0]
+    last = custom_transliterate(last).translate(STRIP_SPACE_HYPHEN)
+
     if typ == "vorname.nachname":
-        # For the "vorname.nachname" format:
-        # - Translate the given name using the mapping and split it on spaces,
-        #   taking only the first segment.
-        # - Concatenate with a period and the translated last name,
-        #   removing any spaces or hyphens.
-        username = (
-            custom_transliterate(given).split(" ")[0]
-            + "."
-            + custom_transliterate(last).replace(" ", "").replace("-", "")
-        )
+        # For the "vorname.nachname" format, join both names with a period
+        username = f"{first}.{last}"
     if typ == "kurzform":
-        # For the "kurzform" type:
-        # - Translate the given name using the mapping and take the first 4 characters.
-        # - Translate the last name using the mapping,
-        #   removing spaces and hyphens, then take the first 4 characters.
-        username = (
-            custom_transliterate(given).split(" ")[0][:4]
-            + custom_transliterate(last)
-            .replace(" ", "")
-            .replace("-", "")[:4]
-        )
-    
+        # For the "kurzform" type, take the first 4 characters of each name
+        username = first[:4] + last[:4]
+
     # Return the generated username in lowercase.
     return username.lower()
 
 
-def strip_hyphens_from_birthday(birthday: str):
+def initial_password(lehrerid: str, username: str, birthday: str):
     """
-    Removes hyphens from a given birthday string.
+    Assembles an initial password from a user's teacher ID, username and birthday.
 
-    This function takes a birthday string in the format 'YYYY-MM-DD' and 
-    returns a new string with all hyphens removed, effectively returning 
-    the birthday as 'YYYYMMDD'.
+    The password is a concatenation of the following components:
+    - The last three characters of the teacher ID (lehrerid).
+    - The last two characters of the username.
+    - The first three characters of the birthday.
+    - The first two characters of the username.
+
+    The birthday is used as stored on the user ('DD.MM.YYYY' or empty). Its
+    first three characters never contain a hyphen, also not for birthdays in
+    the 'YYYY-MM-DD' form, so they need not be stripped beforehand.
 
     Args:
-        birthday (str): The birthday string containing hyphens to be stripped.
+        lehrerid (str): The user's teacher ID.
+        username (str): The user's username.
+        birthday (str): The user's birthday.
 
     Returns:
-        str: The birthday string with hyphens removed.
+        str: The assembled initial password.
     """
-    return birthday.replace("-", "")
+    return f"{lehrerid[-3:]}{username[-2:]}{birthday[:3]}{username[:2]}"
 
 
-def return_initial_password(user):
+def index_data(memberships, groups):
     """
-    Generates an initial password for a user based on specific attributes. 
+    Builds lookup tables for resolving the courses of a user.
 
-    This function constructs the initial password using snippets from the 
-    user's teacher ID, username, and birthday. The format of the password is 
-    a concatenation of the following components:
-    - The last three characters from the user's teacher ID (lehrerid).
-    - The last two characters from the user's username.
-    - The first three characters from the birthday with hyphens removed.
-    - The first two characters from the user's username.
+    Instead of scanning all memberships and groups for every single user, the 
+    memberships are grouped by member ID and the group names are indexed by 
+    group ID once, so that each lookup afterwards is a dictionary access.
 
     Args:
-        user: An instance of the User class containing attributes needed for 
-              password generation (lehrerid, username, birthday).
+        memberships (list): A list of Membership objects.
+        groups (list): A list of Group objects.
 
     Returns:
-        str: The assembled initial password comprising the concatenated parts 
-             derived from user's attributes.
+        tuple: A dictionary mapping each member ID to the list of group IDs the 
+               member belongs to, and a dictionary mapping each group ID to 
+               the group's name.
     """
-    # Construct the initial password using parts of the user's attributes:
+    # Collect the group IDs of all memberships per member
+    groupids_by_nameid = defaultdict(list)
+    for membership in memberships:
+        groupids_by_nameid[membership.nameid].append(membership.groupid)
 
-    # Take the last 3 characters from the user's teacher ID (lehrerid)
-    part_lehrerid = user.lehrerid[-3:]
+    # Map each group ID to the (renamed) name of the group
+    groupname_by_id = {group.groupid: group.name for group in groups}
 
-    # Take the last 2 characters from the user's username
-    part_username_suffix = user.username[-2:]
+    return groupids_by_nameid, groupname_by_id
 
-    # Remove hyphens from the user's birthday, then take the first 3 characters
-    part_birthday = strip_hyphens_from_birthday(user.birthday)[:3]
 
-    # Take the first 2 characters from the user's username
-    part_username_prefix = user.username[:2]
+def return_list_of_courses_of_student(studentid, groupids_by_nameid, groupname_by_id):
+    """
+    Retrieves a list of courses for a student based on their student ID.
 
-    # Return the assembled initial password as a concatenation of the above parts
-    return f"{part_lehrerid}{part_username_suffix}{part_birthday}{part_username_prefix}"
+    This function looks up the groups (courses) a student is associated with in 
+    the membership index and maps each of them to its group name, collecting 
+    these names into a course list. Groups that are unknown or have an empty 
+    name are skipped.
 
+    Args:
+        studentid: A string representing the student ID used to lookup memberships.
+        groupids_by_nameid (dict): Group IDs per member ID, as built by `index_data`.
+        groupname_by_id (dict): Group names per group ID, as built by `index_data`.
 
-def return_list_of_courses_of_student(studentid):
+    Returns:
+        list: A list of strings representing the names of courses the student 
+              is enrolled in. If no courses are found, an empty list is returned.
     """
-    Retrieves a list of courses for a student based on their student ID.
+    return [
+        groupname_by_id[groupid]
+        for groupid in groupids_by_nameid.get(studentid, ())
+        if groupname_by_id.get(groupid)
+    ]
 
-    This function iterates through membership records to identify groups (courses) 
-    that a student is associated with, using the provided student ID. It attempts 
-    to map each membership to a group name from the list of known groups, collecting 
-    these names into a course list.
 
-    If a group name is found, it is added to the list of courses for the student. 
-    An exception handling mechanism is in place to ensure that, in cases where a 
-    group's name cannot be found (possibly due to a mismatch or empty courses), 
-    the function will simply return an empty list.
+def index_courses(users, groupids_by_nameid, groupname_by_id):
+    """
+    Resolves the list of courses of every user once.
+
+    The exports for the individual classes and for the teachers all need the
+    courses of the users, so they are resolved a single time after the groups
+    have been renamed and shared between the exports.
 
     Args:
-        studentid: A string representing the student ID used to lookup memberships.
+        users (list): A list of User objects.
+        groupids_by_nameid (dict): Group IDs per member ID, as built by `index_data`.
+        groupname_by_id (dict): Group names per group ID, as built by `index_data`.
 
     Returns:
-        list: A list of strings representing the names of courses the student 
-              is enrolled in. If no courses are found or an error occurs, an 
-              empty list is returned.
-    """
-    # Initialize an empty list to store course names for a given student
-    courseslist = []
-
-    # Iterate over the group IDs the student is a member of, based on their student ID
-    for course in [
-        membership.groupid
-        for membership in memberships
-        if membership.nameid == studentid
-    ]:
-        try:
-            # Attempt to find the first group name corresponding to the course ID
-            groupname = [group.name for group in groups if group.groupid == course][0]
-            
-            # If a group name is found and it's not an empty string, add it to the courses list
-            if groupname != "":
-                courseslist.append(groupname)
-                
-        except:
-            # If an exception occurs (likely due to the list being empty), return an empty courses list
-            courseslist = []
-
-    # Return the list of course names for the student
-    return courseslist
-
-
-def return_class_of_user(user):
-    """
-    Determines the class of a given user based on their LehrerID and a class mapping.
-
-    This function first obtains a list of courses the user is enrolled in by calling
-    `return_list_of_courses_of_student(user.lehrerid)`. It then uses a predefined
-    mapping dictionary (`mappings.mappingklassen`) to map class identifiers to
-    specific class names.
-
-    The function iterates through each key (class identifier) in the mapping and
-    checks if this class identifier, concatenated with the current school year
-    (`schuljahr`), is present in the list of courses. If a match is found, the
-    corresponding class name from the mapping is returned.
+        dict: Maps each user ID to the list of course names as returned by
+              `return_list_of_courses_of_student`.
+    """
+    return {
+        user.lehrerid: return_list_of_courses_of_student(
+            user.lehrerid, groupids_by_nameid, groupname_by_id
+        )
+        for user in users
+    }
+
+
+@lru_cache(maxsize=None)
+def index_class_mapping(schuljahr):
+    """
+    Indexes the class mapping by the course names the classes appear as.
 
     Args:
-        user: An instance of the User class for whom the class is being determined.
+        schuljahr (str): The school year appended to the class identifiers.
+
+    Returns:
+        dict: Maps each class identifier with the school year appended to a
+              tuple of its position in `mappings.mappingklassen` and the class name.
+    """
+    return {
+        item + schuljahr: (rank, klasse)
+        for rank, (item, klasse) in enumerate(mappings.mappingklassen.items())
+    }
+
+
+def return_class_of_courses(klassen):
+    """
+    Determines the class of a user from the list of their courses and a class mapping.
+
+    The list of courses is expected as returned by `return_list_of_courses_of_student`,
+    so callers that need the courses anyway can resolve them once and share them.
+    This function uses a predefined mapping dictionary (`mappings.mappingklassen`) to
+    map class identifiers to specific class names.
+
+    Each course is looked up in the mapping indexed by `index_class_mapping` for the
+    current school year (`schuljahr`). If several courses match, the class that comes
+    first in the mapping is returned.
+
+    Args:
+        klassen (list): The names of the courses the user is enrolled in.
 
     Returns:
         str: The class name associated with the user if a match is found,
              otherwise None.
     """
-    # Retrieve the list of courses the user is enrolled in based on their LehrerID
-    klassen = return_list_of_courses_of_student(user.lehrerid)
-    
-    # Access the mapping dictionary that maps class identifiers to class names
-    mappingklassen = mappings.mappingklassen
-    
-    # Iterate through each item in the class mapping
-    for item in mappingklassen:
-        # Check if the class identifier with the current school year is present in the user's courses
-        if item + f"{schuljahr}" in klassen:
-            # If found, return the corresponding class name from the mapping
-            return mappingklassen[item]
+    klassen_by_course = index_class_mapping(schuljahr)
+
+    # Look up each of the user's courses and keep the earliest mapping entry
+    found = min(
+        (klassen_by_course[kurs] for kurs in klassen if kurs in klassen_by_course),
+        default=None,
+    )
+    return found[1] if found else None
+
+
+def index_users_by_class(users, courses_by_id):
+    """
+    Groups the users by the class determined from their courses.
+
+    The class exports each select the users of one class, so the class of every
+    user is determined once and the users are grouped by it, instead of checking
+    all users again for every export.
+
+    Args:
+        users (list): A list of User objects.
+        courses_by_id (dict): The course lists per user ID, as built by `index_courses`.
+
+    Returns:
+        dict: Maps each class name (or None for users without a class) to the list
+              of its users, in the order of `users`.
+    """
+    users_by_class = defaultdict(list)
+    for user in users:
+        klasse = return_class_of_courses(courses_by_id[user.lehrerid])
+        users_by_class[klasse].append(user)
+    return users_by_class
 
 
 def create_jamf_accounts(
-    nameOfOutputCsv: str, dict_name_serial: dict, klasse_filter: str = None
+    nameOfOutputCsv: str,
+    dict_name_serial: dict,
+    users: list,
+    courses_by_id: dict,
+    users_by_class: dict,
+    klasse_filter: str = None,
 ):
     """
     Generates a JAMF-compatible CSV file with account details for users, potentially
@@ -700,6 +782,10 @@ def create_jamf_accounts(
     Args:
         nameOfOutputCsv (str): The path and name of the output CSV file to be created.
         dict_name_serial (dict): A dictionary mapping names to serial numbers for device assignment.
+        users (list): All User objects; exported when no class filter is applied.
+        courses_by_id (dict): The course lists per user ID, as built by `index_courses`
+                              for the renamed groups.
+        users_by_class (dict): The users per class, as built by `index_users_by_class`.
         klasse_filter (str, optional): A filter string representing a class name to limit which users 
                                        are included. Defaults to None.
 
@@ -713,52 +799,59 @@ def create_jamf_accounts(
         with open(f"{klasse_filter}.csv", "r", encoding="utf-8") as file:
             reader = csv.reader(file)  # Create a CSV reader object
             next(reader)  # Skip the header line
-            # Populate ser_nums with serial numbers from the specific file
-            ser_nums = [dict_name_serial[rows[0]] for rows in reader]
+            # Populate ser_nums with serial numbers from the specific file; unknown
+            # devices keep their place with an empty serial number so that the
+            # remaining serial numbers stay aligned with the users
+            ser_nums = [dict_name_serial.get(rows[0], "") for rows in reader]
+
+    with open(
+        nameOfOutputCsv, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_SIZE
+    ) as f:
+        writer = csv.writer(f, delimiter=";", lineterminator="\n")
 
-    with open(nameOfOutputCsv, "w", encoding="utf-8") as f:
         # Define the headers for the output CSV file, including SerialNumber if needed
-        if ser_nums:
-            f.write("Username;Email;FirstName;LastName;Groups;Password;SerialNumber\n")
-        else:
-            f.write("Username;Email;FirstName;LastName;Groups;Password\n")
+        header = ["Username", "Email", "FirstName", "LastName", "Groups", "Password"]
+        writer.writerow(header + ["SerialNumber"] if ser_nums else header)
+
+        # Select the users of the requested class, if a class filter is applied;
+        # their courses, resolved once in `courses_by_id`, give the groups
+        selected_users = (
+            (user, courses_by_id[user.lehrerid])
+            for user in (users_by_class.get(klasse_filter, ()) if klasse_filter else users)
+        )
 
-        i = 0  # Initialize counter for serial numbers
-        for user in users:
-            # Filter users by class if a class filter is applied
-            if klasse_filter and return_class_of_user(user) != klasse_filter:
-                continue
+        # Map user info to the specific CSV structure, with the user's courses as groups
+        rows = (
+            (
+                f"{SCHULNUMMER}-{user.username}",
+                f"{user.username}@{SCHULNUMMER}.nrw.schule",
+                user.jamf_firstname,
+                user.jamf_lastname,
+                ",".join(courses),
+                user.initialpassword,
+            )
+            for user, courses in selected_users
+        )
 
-            # Retrieve user courses and formats them into groups
-            courses = return_list_of_courses_of_student(user.lehrerid)
-            groups = ",".join(courses)
-            # Map user info to the specific CSV structure
-            user_data_mapping = {
-                "Username": f"164501-{user.username}",
-                "Email": f"{user.username}@164501.nrw.schule",
-                "FirstName": f"{user.username[:4]}",
-                "LastName": f"{user.username[4:]}",
-                "Groups": groups,
-                "Password": f"{return_initial_password(user)}",
-            }
-
-            # Write user data to the file, including serial numbers if available
-            if ser_nums:
-                f.write(
-                    f"{user_data_mapping['Username']};{user_data_mapping['Email']};"
-                    f"{user_data_mapping['FirstName']};{user_data_mapping['LastName']};"
-                    f"{user_data_mapping['Groups']};{user_data_mapping['Password']};{ser_nums[i]}\n"
-                )
-                i += 1  # Increment the serial number index
-            else:
-                f.write(
-                    f"{user_data_mapping['Username']};{user_data_mapping['Email']};"
-                    f"{user_data_mapping['FirstName']};{user_data_mapping['LastName']};"
-                    f"{user_data_mapping['Groups']};{user_data_mapping['Password']}\n"
-                )
+        # Append the serial numbers in order, if available; users beyond the end of
+        # the device list get an empty serial number, surplus devices are ignored
+        if ser_nums:
+            rows = (
+                row + (serial,) for row, serial in zip(rows, chain(ser_nums, repeat("")))
+            )
+
+        # Write all rows at once; they are produced lazily while writing
+        writer.writerows(rows)
 
 
-def create_jamf_accounts_teachers(nameOfOutputCsv: str, klasse_filter: str = None):
+def create_jamf_accounts_teachers(
+    nameOfOutputCsv: str,
+    users: list,
+    groups: list,
+    groupids_by_nameid: dict,
+    courses_by_id: dict,
+    klasse_filter: str = None,
+):
     """
     Generates a JAMF-compatible CSV file specifically for teachers' accounts.
 
@@ -775,69 +868,83 @@ def create_jamf_accounts_teachers(nameOfOutputCsv: str, klasse_filter: str = Non
 
     Args:
         nameOfOutputCsv (str): The path and name of the output CSV file to be created.
+        users (list): All User objects.
+        groups (list): All Group objects, after renaming by `rename_groups`.
+        groupids_by_nameid (dict): Group IDs per member ID, as built by `index_data`.
+        courses_by_id (dict): The course lists per user ID, as built by `index_courses`
+                              for the renamed groups.
         klasse_filter (str, optional): Currently not used in this implementation but kept 
                                        for interface consistency.
 
     Writes:
         A CSV file at the specified path with the teacher account information formatted for JAMF.
     """
-    with open(nameOfOutputCsv, "w", encoding="utf-8") as f:
+    # Key the email mapping by normalized email, matching the stored user emails
+    mapping_email_kuerzel = {
+        email.strip().lower(): kuerzel
+        for email, kuerzel in mappings.mapping_email_kuerzel.items()
+    }
+
+    # Look up the IDs of all groups renamed to "AlleL" once, so non-teachers can
+    # be skipped before their courses are resolved
+    alle_lehrer_ids = frozenset(
+        group.groupid for group in groups if group.name == "AlleL"
+    )
+
+    with open(
+        nameOfOutputCsv, "w", encoding="utf-8", newline="", buffering=WRITE_BUFFER_SIZE
+    ) as f:
+        writer = csv.writer(f, delimiter=";", lineterminator="\n")
+
         # Write the header line to the output CSV file
-        f.write("Username;Email;FirstName;LastName;TeacherGroups;Groups;Password\n")
+        writer.writerow(
+            ["Username", "Email", "FirstName", "LastName", "TeacherGroups", "Groups", "Password"]
+        )
 
+        rows = []
         for user in users:
-            # Get the list of courses for each user and convert to a CSV-friendly format
-            courses = return_list_of_courses_of_student(user.lehrerid)
-            groups = f'{"##".join(courses)}'.replace("##", ",")
-
-            # Check if "AlleL" (assumed to mean 'all teachers') is in the group list
-            if "AlleL" in groups:
-                # Filter to select groups matching specific patterns (grades and levels)
-                filtered_groups = []
-                for group in groups.split(","):
-                    if any(
-                        substring in group for substring in ["09", "10", "EF", "Q1"]
-                    ) and group not in ["EFL24", "Q1L24", "Q2L24"]:
-                        filtered_groups.append(group)
-
-                # Update group names by replacing 'L' with 'S' for specific grades
-                updated_groups = []
-                for group in filtered_groups:
-                    if (
-                        len(group) == 6
-                        and group[0:2] in ["09", "10"]
-                        and group[3] == "L"
-                    ):
-                        updated_groups.append(group[:3] + "S" + group[4:])
-                    else:
-                        updated_groups.append(group)
-                groups = ",".join(updated_groups)
-                groups = (
-                    groups
-                    + ", iPads-Lehrerzimmer_1-15, iPads-Lehrerzimmer_alle, iPads-Lehrerzimmer_16-30"
-                )
+            # Skip users who are not members of "AlleL" (assumed to mean 'all teachers')
+            if alle_lehrer_ids.isdisjoint(groupids_by_nameid.get(user.lehrerid, ())):
+                continue
 
-                # Map user's email to a specific key or use an alternate ID
-                try:
-                    email_kuerzel = mappings.mapping_email_kuerzel[user.email]
-                except KeyError:
-                    email_kuerzel = return_webuntis_uid(user)
-
-                # Define user data mapping for CSV output
-                user_data_mapping = {
-                    "Username": f"164501-{return_username(email_kuerzel, '', 'kurzform')}",
-                    "Email": f"{return_username(email_kuerzel, '', 'kurzform')}@164501.nrw.schule",
-                    "FirstName": email_kuerzel,
-                    "LastName": email_kuerzel,
-                    "TeacherGroups": groups,
-                    "Groups": "AlleL",
-                    "Password": return_initial_password(user),
-                }
-
-                # Write the user data line to the output file
-                f.write(
-                    f"{user_data_mapping['Username']};{user_data_mapping['Email']};{user_data_mapping['FirstName']};{user_data_mapping['LastName']};{user_data_mapping['TeacherGroups']};{user_data_mapping['Groups']};{user_data_mapping['Password']}\n"
+            # Get the list of courses for each teacher
+            courses = courses_by_id[user.lehrerid]
+
+            # Select groups matching specific patterns (grades and levels) and
+            # rename them in the same pass, replacing 'L' with 'S' for specific grades
+            updated_groups = []
+            for group in courses:
+                if not GRADE_RE.search(group) or group in SKIP_TEACHER_GROUPS:
+                    continue
+                if len(group) == 6 and group[:2] in ("09", "10") and group[3] == "L":
+                    group = group[:3] + "S" + group[4:]
+                updated_groups.append(group)
+            groups_str = ",".join(updated_groups) + TEACHER_EXTRA_GROUPS
+
+            # Map user's email to a specific key or use an alternate ID
+            try:
+                email_kuerzel = mapping_email_kuerzel[user.email]
+            except KeyError:
+                email_kuerzel = return_webuntis_uid(user)
+
+            # Derive the account name from the teacher's abbreviation
+            kuerzel_username = return_username(email_kuerzel, "", "kurzform")
+
+            # Collect the user data line for the output file
+            rows.append(
+                (
+                    f"{SCHULNUMMER}-{kuerzel_username}",
+                    f"{kuerzel_username}@{SCHULNUMMER}.nrw.schule",
+                    email_kuerzel,
+                    email_kuerzel,
+                    groups_str,
+                    "AlleL",
+                    user.initialpassword,
                 )
+            )
+
+        # Write all teacher rows at once
+        writer.writerows(rows)
 
 
 # =========================
@@ -846,10 +953,10 @@ def create_jamf_accounts_teachers(nameOfOutputCsv: str, klasse_filter: str = Non
 
 if __name__ == "__main__":
     # Set the path to the current XML file containing the user, group, and membership information
-    inputaktuell = "./xml/SchILD20241007.xml"
+    inputaktuell = INPUT_XML
     
     # Extract the date from the input file name by filtering digits
-    exportdate = "".join([i for i in inputaktuell if i.isdigit()])
+    exportdate = NON_DIGIT_RE.sub("", inputaktuell)
     
     # Print the extracted export date
     print(exportdate)
@@ -859,20 +966,22 @@ if __name__ == "__main__":
     groups = []
     memberships = []
     
-    # Parse the XML file to build an ElementTree object
-    tree = ET.parse(inputaktuell)
-    
     # Determine the school year from the XML file and clean up the format
     schuljahr = parse_year(inputaktuell).replace("/", "")
     
-    # Get the root element of the XML tree
-    root = tree.getroot()
-    
-    # Parse the XML to populate the lists of users, groups, and memberships
-    parse_xml(users, groups, memberships)
+    # Stream the XML file to populate the lists of users, groups, and memberships
+    parse_xml(inputaktuell, users, groups, memberships)
     
     # Rename groups based on preset rules and mappings
     rename_groups()
+
+    # Index memberships and the renamed group names, and resolve the courses of
+    # all users once for all exports
+    groupids_by_nameid, groupname_by_id = index_data(memberships, groups)
+    courses_by_id = index_courses(users, groupids_by_nameid, groupname_by_id)
+
+    # Group the users by class once for all class exports
+    users_by_class = index_users_by_class(users, courses_by_id)
     
     # Generate a dictionary mapping names to device serial numbers
     dict_name_serial = utils.get_dict_name_serial("devices20241010.csv")
@@ -883,14 +992,24 @@ if __name__ == "__main__":
     # for user in users:
     #     print(user.lehrerid)
 
-    # Generate CSV files for different classes based on a specific class filter
-    create_jamf_accounts(f"./csv/01-jamf{exportdate}.csv", dict_name_serial, "EF")
-    create_jamf_accounts(f"./csv/02-jamf{exportdate}.csv", dict_name_serial, "10b")
-    create_jamf_accounts(f"./csv/03-jamf{exportdate}.csv", dict_name_serial, "10a")
-    create_jamf_accounts(f"./csv/04-jamf{exportdate}.csv", dict_name_serial, "10c")
-    create_jamf_accounts(f"./csv/05-jamf{exportdate}.csv", dict_name_serial, "9a")
-    create_jamf_accounts(f"./csv/06-jamf{exportdate}.csv", dict_name_serial, "9b")
-    create_jamf_accounts(f"./csv/07-jamf{exportdate}.csv", dict_name_serial, "9c")
+    # Generate CSV files for different classes based on a specific class filter,
+    # numbered 01 to 07 in this order
+    for nummer, klasse in enumerate(("EF", "10b", "10a", "10c", "9a", "9b", "9c"), 1):
+        create_jamf_accounts(
+            f"./csv/{nummer:02d}-jamf{exportdate}.csv",
+            dict_name_serial,
+            users,
+            courses_by_id,
+            users_by_class,
+            klasse,
+        )
     
     # Create a CSV for teacher accounts
-    create_jamf_accounts_teachers(f"./csv/08-jamf{exportdate}.csv", "None")
+    create_jamf_accounts_teachers(
+        f"./csv/08-jamf{exportdate}.csv",
+        users,
+        groups,
+        groupids_by_nameid,
+        courses_by_id,
+        "None",
+    )